@@ -1,6 +1,7 @@
 import logging
 import os
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
 from pymongo import MongoClient
 from telegram import (
@@ -13,6 +14,8 @@ from telegram.ext import (
 )
 from telegram.helpers import escape_markdown
 from datetime import datetime
+from outbound import OutboundSender
+from resilience import REQUEST_ERRORS, TRANSIENT_ERRORS, ResilientGenerator
 import pytesseract
 from PIL import Image
 import io
@@ -28,6 +31,11 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 MONGO_URI = os.getenv("MONGO_URI")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-pro")
+GEMINI_FALLBACK_MODELS = os.getenv("GEMINI_FALLBACK_MODELS", "")
+GEMINI_VISION_MODEL = os.getenv("GEMINI_VISION_MODEL", "gemini-pro-vision")
+GEMINI_VISION_FALLBACK_MODELS = os.getenv("GEMINI_VISION_FALLBACK_MODELS", "")
+GEMINI_HEDGE_DELAY = os.getenv("GEMINI_HEDGE_DELAY")  # unset: hedge after observed p95 latency
 
 # Create downloads directory
 os.makedirs("downloads", exist_ok=True)
@@ -47,8 +55,6 @@ logger = logging.getLogger(__name__)
 
 # Configure Gemini
 genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-pro')
-vision_model = genai.GenerativeModel('gemini-pro-vision')
 
 # Generation config
 generation_config = {
@@ -79,12 +85,55 @@ safety_settings = [
     }
 ]
 
+# Gemini errors worth retrying on the same model
+GEMINI_TRANSIENT_ERRORS = TRANSIENT_ERRORS + (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.TooManyRequests,
+    google_exceptions.InternalServerError,
+)
+
+# Gemini errors caused by the request itself; every fallback model would reject them too.
+# Anything else (e.g. NotFound for a retired model, PermissionDenied, DeadlineExceeded)
+# counts against the model and falls back to the next one.
+GEMINI_REQUEST_ERRORS = REQUEST_ERRORS + (
+    google_exceptions.BadRequest,
+    genai.types.BlockedPromptException,
+    genai.types.StopCandidateException,
+)
+
+# Model chains per task: (primary, comma-separated fallbacks)
+MODEL_CHAINS = {
+    "text": (GEMINI_MODEL, GEMINI_FALLBACK_MODELS),
+    "vision": (GEMINI_VISION_MODEL, GEMINI_VISION_FALLBACK_MODELS),
+}
+GENERATORS = {}
+
+
+def build_model_chain(primary: str, fallbacks: str) -> list:
+    names = [primary] + [name.strip() for name in fallbacks.split(",") if name.strip()]
+    return [(name, genai.GenerativeModel(name)) for name in dict.fromkeys(names)]
+
+
+def get_generator(kind: str) -> ResilientGenerator:
+    """Return the generator for "text" or "vision", building its model chain on first use."""
+    if kind not in GENERATORS:
+        GENERATORS[kind] = ResilientGenerator(
+            build_model_chain(*MODEL_CHAINS[kind]),
+            transient_errors=GEMINI_TRANSIENT_ERRORS,
+            request_errors=GEMINI_REQUEST_ERRORS,
+            hedge_delay=float(GEMINI_HEDGE_DELAY) if GEMINI_HEDGE_DELAY else None
+        )
+    return GENERATORS[kind]
+
 # Temporary state storage
 USER_STATE = {}
 
 # Tesseract OCR setup
 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
+# Outbound message queue
+outbound = OutboundSender()
+
 async def perform_web_search(query: str) -> str:
     try:
         logger.info(f"Starting web search for query: {query}")
@@ -101,13 +150,13 @@ async def perform_web_search(query: str) -> str:
         formatted_results = f"🔍 Search Results for: '{html.escape(query)}'\n\n"
         
         for i, url in enumerate(search_results, 1):
-            formatted_results += f"{i}. 🔗 {url}\n\n"
+            formatted_results += f"{i}. 🔗 {html.escape(url)}\n\n"
 
         # Generate AI summary
         summary_prompt = f"Provide a brief summary of search results about: {query}"
         try:
             ai_summary = await generate_gemini_response(summary_prompt)
-            formatted_results += f"\n📝 AI Summary:\n{ai_summary}"
+            formatted_results += f"\n📝 AI Summary:\n{html.escape(ai_summary)}"
         except Exception as e:
             logger.error(f"AI summary generation error: {e}")
             formatted_results += "\n⚠️ AI summary generation failed."
@@ -128,7 +177,7 @@ If the problem persists, contact support."""
 
 async def generate_gemini_response(prompt: str) -> str:
     try:
-        response = model.generate_content(
+        response = await get_generator("text").generate(
             prompt,
             generation_config=generation_config,
             safety_settings=safety_settings
@@ -168,7 +217,7 @@ async def analyze_image_with_gemini(image_path: str) -> str:
             ]
         }
 
-        response = vision_model.generate_content(
+        response = await get_generator("vision").generate(
             contents=contents,
             generation_config=generation_config,
             safety_settings=safety_settings
@@ -409,21 +458,13 @@ Tips:
             search_results = await perform_web_search(query)
             await status_message.delete()
             
-            # Split long messages if needed
-            if len(search_results) > 4096:
-                chunks = [search_results[i:i+4000] for i in range(0, len(search_results), 4000)]
-                for chunk in chunks:
-                    await update.message.reply_text(
-                        chunk,
-                        disable_web_page_preview=True,
-                        parse_mode='HTML'
-                    )
-            else:
-                await update.message.reply_text(
-                    search_results,
-                    disable_web_page_preview=True,
-                    parse_mode='HTML'
-                )
+            outbound.reply(
+                context,
+                update.effective_chat.id,
+                search_results,
+                disable_web_page_preview=True,
+                parse_mode='HTML'
+            )
         except Exception as e:
             logger.error(f"Search handling error: {e}")
             await status_message.edit_text(
@@ -447,12 +488,7 @@ Tips:
 
             await thinking_msg.delete()
 
-            if len(bot_response) > 4096:
-                chunks = [bot_response[i:i+4000] for i in range(0, len(bot_response), 4000)]
-                for chunk in chunks:
-                    await update.message.reply_text(chunk)
-            else:
-                await update.message.reply_text(bot_response)
+            outbound.reply(context, update.effective_chat.id, bot_response)
 
         except Exception as e:
             logger.error(f"Error in message handling: {str(e)}")
@@ -638,14 +674,12 @@ For best results, ensure:
 
         await processing_message.delete()
 
-        # Split long responses if needed
-        if len(description) > 4096:
-            chunks = [description[i:i+4000] for i in range(0, len(description), 4000)]
-            for i, chunk in enumerate(chunks):
-                header = "📄 Analysis (continued):\n\n" if i > 0 else ""
-                await update.message.reply_text(f"{header}{chunk}")
-        else:
-            await update.message.reply_text(description)
+        outbound.reply(
+            context,
+            update.effective_chat.id,
+            description,
+            continuation_header="📄 Analysis (continued):\n\n"
+        )
 
     except Exception as e:
         logger.error(f"Error processing file: {str(e)}")
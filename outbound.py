@@ -0,0 +1,277 @@
+import asyncio
+import html
+import logging
+import re
+import unicodedata
+from collections import deque
+from datetime import timedelta
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError, TimedOut
+
+logger = logging.getLogger(__name__)
+
+# Outbound message limits
+CHUNK_SIZE = 4000  # Telegram allows 4096 UTF-16 units per message; keep headroom
+PER_CHAT_SEND_INTERVAL = 1.0  # seconds between messages to the same chat
+GLOBAL_SENDS_PER_SECOND = 30
+MAX_SEND_RETRIES = 3
+
+# Preferred split points, strongest first: paragraphs, lines, sentences, words
+_BREAK_PATTERNS = (
+    re.compile(r"\n\s*\n"),
+    re.compile(r"\n"),
+    re.compile(r"(?<=[.!?…。])\s+"),
+    re.compile(r"\s+"),
+)
+_HTML_TAG_RE = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9-]*)\b[^>]*>")
+_HTML_ENTITY_TAIL_RE = re.compile(r"&#?[a-zA-Z0-9]*$")
+_HTML_ENTITY_RE = re.compile(r"&#?[a-zA-Z0-9]+;")
+
+
+def _utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _utf16_prefix(text: str, limit: int) -> int:
+    # Return the largest index such that text[:index] fits in `limit` UTF-16 units
+    used = 0
+    for index, char in enumerate(text):
+        used += 2 if ord(char) > 0xFFFF else 1
+        if used > limit:
+            return index
+    return len(text)
+
+
+def _inside_html_tag(text: str, pos: int) -> bool:
+    return text.rfind("<", 0, pos) > text.rfind(">", 0, pos)
+
+
+def _joins_previous(char: str) -> bool:
+    # Combining marks, variation selectors, ZWJ and skin tones belong to the previous glyph
+    return (
+        unicodedata.combining(char) > 0
+        or char in ("\u200d", "\ufe0e", "\ufe0f")
+        or "\U0001f3fb" <= char <= "\U0001f3ff"
+    )
+
+
+def _leading_tags_end(text: str) -> int:
+    # Return the index just past any tags at the very start of text
+    pos = 0
+    match = _HTML_TAG_RE.match(text, pos)
+    while match:
+        pos = match.end()
+        match = _HTML_TAG_RE.match(text, pos)
+    return pos
+
+
+def _first_glyph_end(text: str, pos: int, html_mode: bool) -> int:
+    # Return the index just past the character (or entity) starting at pos
+    entity = _HTML_ENTITY_RE.match(text, pos) if html_mode else None
+    pos = entity.end() if entity else pos + 1
+    while pos < len(text) and (_joins_previous(text[pos]) or text[pos - 1] == "\u200d"):
+        pos += 1
+    return pos
+
+
+def _find_split_point(text: str, limit: int, html_mode: bool, min_pos: int = 0) -> int:
+    # Pick where to cut text so the head fits in limit; the cut is always past min_pos
+    window = _utf16_prefix(text, limit)
+
+    for pattern in _BREAK_PATTERNS:
+        best = None
+        for match in pattern.finditer(text, 0, window):
+            if match.start() > min_pos and not (html_mode and _inside_html_tag(text, match.start())):
+                best = match.start()
+        if best is not None and best >= window // 2:
+            return best
+
+    # No natural boundary: hard cut without breaking markup or glyphs
+    cut = window
+    if html_mode:
+        if _inside_html_tag(text, cut):
+            cut = text.rfind("<", 0, cut)
+        entity = _HTML_ENTITY_TAIL_RE.search(text, max(0, cut - 10), cut)
+        if entity:
+            cut = entity.start()
+    while cut > 0 and (_joins_previous(text[cut]) or text[cut - 1] == "\u200d"):
+        cut -= 1
+    if cut <= min_pos:
+        # Never cut into the leading tags; take at least one visible character
+        cut = _first_glyph_end(text, min_pos, html_mode)
+    return cut
+
+
+def _unclosed_html_tags(text: str) -> list:
+    stack = []
+    for match in _HTML_TAG_RE.finditer(text):
+        closing, name = match.group(1), match.group(2).lower()
+        if not closing:
+            stack.append((name, match.group(0)))
+            continue
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i][0] == name:
+                del stack[i:]
+                break
+    return stack
+
+
+def _strip_html(text: str) -> str:
+    return html.unescape(_HTML_TAG_RE.sub("", text))
+
+
+def split_message(text: str, limit: int = CHUNK_SIZE, parse_mode: str = None) -> list:
+    """Split text into Telegram-sized chunks on paragraph, sentence or word boundaries.
+
+    In HTML mode tags and entities are never cut; tags open across a split are closed
+    and reopened, and if they leave no room for text the rest is sent unformatted.
+    """
+    html_mode = (parse_mode or "").upper() == "HTML"
+    chunks = []
+    remaining = text
+
+    while remaining:
+        if _utf16_len(remaining) <= limit:
+            if not (html_mode and chunks) or _strip_html(remaining).strip():
+                chunks.append(remaining)
+            break
+
+        # Every pass must consume text past the leading (reopened) tags
+        min_pos = _leading_tags_end(remaining) if html_mode else 0
+        floor = _utf16_len(remaining[:min_pos])
+        budget = limit
+        while True:
+            cut = _find_split_point(remaining, budget, html_mode, min_pos)
+            head, tail = remaining[:cut].rstrip(), remaining[cut:].lstrip()
+            open_tags = _unclosed_html_tags(head) if html_mode else []
+            closing = "".join(f"</{name}>" for name, _ in reversed(open_tags))
+            overflow = _utf16_len(head + closing) - limit
+            if overflow <= 0:
+                break
+            if budget <= floor:
+                # Only a single glyph is left to cut; give up on markup if it is to blame
+                if html_mode and _HTML_TAG_RE.search(head):
+                    head = None
+                break
+            budget = max(floor, budget - overflow)
+
+        if head is None:
+            remaining = html.escape(_strip_html(remaining))
+            continue
+
+        if _strip_html(head).strip():
+            chunks.append(head + closing)
+        reopen = "".join(tag for _, tag in open_tags)
+        remaining = reopen + tail if tail else ""
+
+    return chunks
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    delay = error.retry_after
+    if isinstance(delay, timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+
+class OutboundSender:
+    """Queues outgoing messages per chat and delivers them within Telegram's rate limits."""
+
+    def __init__(self, per_chat_interval=PER_CHAT_SEND_INTERVAL,
+                 global_rate=GLOBAL_SENDS_PER_SECOND, max_retries=MAX_SEND_RETRIES):
+        self.per_chat_interval = per_chat_interval
+        self.global_interval = 1.0 / global_rate
+        self.max_retries = max_retries
+        self._queues = {}
+        self._workers = {}
+        self._chat_ready_at = {}
+        self._next_global_slot = 0.0
+        self._global_lock = asyncio.Lock()
+
+    def reply(self, context, chat_id: int, text: str, continuation_header: str = "", **kwargs):
+        """Split a reply into chunks and queue them without waiting on the sends."""
+        limit = CHUNK_SIZE - _utf16_len(continuation_header)
+        chunks = split_message(text, limit, kwargs.get("parse_mode"))
+        for i, chunk in enumerate(chunks):
+            header = continuation_header if i > 0 else ""
+            self.enqueue(context, chat_id, f"{header}{chunk}", **kwargs)
+
+    def enqueue(self, context, chat_id: int, text: str, **kwargs):
+        self._queues.setdefault(chat_id, deque()).append((text, kwargs))
+        worker = self._workers.get(chat_id)
+        if worker is None or worker.done():
+            # Tasks created through the application are awaited when it stops
+            self._workers[chat_id] = context.application.create_task(
+                self._drain(context.bot, chat_id)
+            )
+
+    async def _drain(self, bot, chat_id: int):
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                text, kwargs = queue.popleft()
+                await self._deliver(bot, chat_id, text, kwargs)
+        finally:
+            if queue:
+                logger.warning(f"Dropping {len(queue)} queued messages for chat {chat_id}")
+            self._queues.pop(chat_id, None)
+            self._workers.pop(chat_id, None)
+            self._forget_chat(chat_id)
+
+    def _forget_chat(self, chat_id: int):
+        # Drop pacing state for an idle chat once its send interval has passed
+        if chat_id in self._workers:
+            return
+        loop = asyncio.get_running_loop()
+        delay = self._chat_ready_at.get(chat_id, 0.0) - loop.time()
+        if delay > 0:
+            loop.call_later(delay, self._forget_chat, chat_id)
+        else:
+            self._chat_ready_at.pop(chat_id, None)
+
+    async def _wait_for_slot(self, chat_id: int):
+        loop = asyncio.get_running_loop()
+        delay = self._chat_ready_at.get(chat_id, 0.0) - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        async with self._global_lock:
+            now = loop.time()
+            if self._next_global_slot > now:
+                await asyncio.sleep(self._next_global_slot - now)
+            self._next_global_slot = max(now, self._next_global_slot) + self.global_interval
+
+        self._chat_ready_at[chat_id] = loop.time() + self.per_chat_interval
+
+    async def _deliver(self, bot, chat_id: int, text: str, kwargs: dict):
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_slot(chat_id)
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                return
+            except RetryAfter as e:
+                delay = _retry_after_seconds(e)
+                logger.warning(f"Flood control for chat {chat_id}, retrying in {delay}s")
+                # Flood limits also apply bot-wide, so hold back every chat
+                resume_at = asyncio.get_running_loop().time() + delay
+                self._chat_ready_at[chat_id] = resume_at
+                self._next_global_slot = max(self._next_global_slot, resume_at)
+            except BadRequest as e:
+                if kwargs.get("parse_mode") and "parse entities" in str(e).lower():
+                    logger.warning(f"Markup rejected for chat {chat_id}, sending as plain text")
+                    text = _strip_html(text)
+                    kwargs = {k: v for k, v in kwargs.items() if k != "parse_mode"}
+                    continue
+                logger.error(f"Send rejected for chat {chat_id}: {e}")
+                return
+            except TimedOut as e:
+                # The message may have been delivered anyway; resending risks a duplicate
+                logger.warning(f"Send to chat {chat_id} timed out, not resending: {e}")
+                return
+            except NetworkError as e:
+                logger.warning(f"Network error sending to chat {chat_id}: {e}")
+                await asyncio.sleep(2 ** attempt)
+            except TelegramError as e:
+                logger.error(f"Send failed for chat {chat_id}: {e}")
+                return
+        logger.error(f"Giving up on message to chat {chat_id} after {self.max_retries + 1} attempts")
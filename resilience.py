@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+# Upstream resilience defaults
+MAX_RETRIES = 2
+RETRY_BASE_DELAY = 0.5  # seconds
+RETRY_MAX_DELAY = 8.0
+REQUEST_TIMEOUT = 60.0  # per upstream call
+REQUEST_DEADLINE = 90.0  # for the whole request, across retries and fallbacks
+HEDGE_DELAY = None  # None: hedge after the model's observed p95 latency; 0: never hedge
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 100
+MAX_CONCURRENT_CALLS = 8
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30.0
+
+# Error groups; providers extend these with their own exception types.
+# Transient errors are retried on the same model, request errors are raised at once
+# since every model would reject the request, and anything else (including a call
+# that used its whole timeout) counts against the model and moves on to the next one.
+TRANSIENT_ERRORS = (ConnectionError,)
+REQUEST_ERRORS = (ValueError, TypeError)
+
+
+class CircuitOpenError(Exception):
+    """Raised when every model in a chain is unavailable because its circuit is open."""
+
+
+class CircuitBreaker:
+    """Fails fast for a model after repeated failures, then lets one trial call through."""
+
+    def __init__(self, name: str, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=BREAKER_RESET_TIMEOUT, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Return True if closed, "trial" if this call is the half-open trial, else False."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return "trial"
+        return False
+
+    def release_trial(self):
+        self._trial_in_flight = False
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._trial_in_flight or self._failures >= self.failure_threshold:
+            if self._opened_at is None or self._trial_in_flight:
+                logger.warning(f"Circuit for {self.name} opened after {self._failures} failures")
+            self._opened_at = self._clock()
+            self._trial_in_flight = False
+
+
+CIRCUIT_BREAKERS = {}
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    if name not in CIRCUIT_BREAKERS:
+        CIRCUIT_BREAKERS[name] = CircuitBreaker(name)
+    return CIRCUIT_BREAKERS[name]
+
+
+class ResilientGenerator:
+    """Calls `generate_content` on a chain of (name, model) pairs with retries and hedging."""
+
+    def __init__(self, models: list, transient_errors=TRANSIENT_ERRORS,
+                 request_errors=REQUEST_ERRORS, max_retries=MAX_RETRIES,
+                 base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                 timeout=REQUEST_TIMEOUT, deadline=REQUEST_DEADLINE,
+                 hedge_delay=HEDGE_DELAY, max_concurrency=MAX_CONCURRENT_CALLS,
+                 breaker_factory=get_circuit_breaker):
+        self.models = models
+        self.transient_errors = tuple(transient_errors)
+        self.request_errors = tuple(request_errors)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.deadline = deadline
+        self.hedge_delay = hedge_delay
+        self.breakers = {name: breaker_factory(name) for name, _ in models}
+        self._latencies = {name: deque(maxlen=LATENCY_WINDOW) for name, _ in models}
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency,
+                                            thread_name_prefix="upstream")
+
+    async def generate(self, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        last_error = None
+        for name, model in self.models:
+            if loop.time() >= deadline:
+                raise asyncio.TimeoutError("Request deadline passed") from last_error
+            breaker = self.breakers[name]
+            allowed = breaker.allow()
+            if not allowed:
+                logger.warning(f"Skipping {name}: circuit open")
+                continue
+            try:
+                return await self._call_with_retries(name, model, breaker, deadline, args, kwargs)
+            except self.request_errors:
+                raise
+            except Exception as e:
+                logger.error(f"Model {name} failed: {str(e)}")
+                last_error = e
+            finally:
+                if allowed == "trial":
+                    breaker.release_trial()
+        if last_error is None:
+            raise CircuitOpenError("All models are temporarily unavailable")
+        raise last_error
+
+    async def _call_with_retries(self, name, model, breaker, deadline, args, kwargs):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            call_timeout = min(self.timeout, deadline - loop.time())
+            if call_timeout <= 0:
+                raise asyncio.TimeoutError(f"Request deadline passed before calling {name}")
+            try:
+                response = await self._hedged_call(name, model, call_timeout, args, kwargs)
+            except self.transient_errors as e:
+                breaker.record_failure()
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if (attempt == self.max_retries or breaker.state != "closed"
+                        or loop.time() + delay >= deadline):
+                    raise
+                logger.warning(f"Transient error from {name} ({e!r}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            except self.request_errors:
+                # The model answered but rejected the request, so it is still healthy
+                breaker.record_success()
+                raise
+            except asyncio.TimeoutError:
+                # A call that used its whole timeout is not repeated on the same model;
+                # one cut short by the request deadline says nothing about the model
+                if call_timeout >= self.timeout:
+                    breaker.record_failure()
+                raise
+            except Exception:
+                breaker.record_failure()
+                raise
+            else:
+                breaker.record_success()
+                return response
+
+    def _current_hedge_delay(self, name):
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        samples = self._latencies[name]
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return 0
+        return sorted(samples)[int(len(samples) * HEDGE_PERCENTILE)]
+
+    async def _single_call(self, name, model, call_timeout, args, kwargs):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + call_timeout
+        await asyncio.wait_for(self._slots.acquire(), timeout=call_timeout)
+
+        # The slot is held until the worker thread really finishes, not just until we
+        # stop waiting, so abandoned calls still count against the concurrency limit
+        options = {**kwargs.get("request_options", {}), "timeout": call_timeout}
+        call = partial(model.generate_content, *args, **{**kwargs, "request_options": options})
+        try:
+            future = loop.run_in_executor(self._executor, call)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._release_slot)
+
+        started = loop.time()
+        response = await asyncio.wait_for(asyncio.shield(future), timeout=deadline - loop.time())
+        self._latencies[name].append(loop.time() - started)
+        return response
+
+    def _release_slot(self, future):
+        self._slots.release()
+        if not future.cancelled():
+            future.exception()  # mark abandoned results as retrieved
+
+    async def _hedged_call(self, name, model, call_timeout, args, kwargs):
+        pending = {asyncio.create_task(self._single_call(name, model, call_timeout, args, kwargs))}
+        try:
+            hedge_delay = self._current_hedge_delay(name)
+            if hedge_delay and hedge_delay < call_timeout:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    remaining = call_timeout - hedge_delay
+                    pending.add(asyncio.create_task(
+                        self._single_call(name, model, remaining, args, kwargs)
+                    ))
+
+            last_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,181 @@
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+from outbound import (
+    OutboundSender, _HTML_TAG_RE, _inside_html_tag, _strip_html, _utf16_len, split_message
+)
+
+
+def assert_balanced(chunk):
+    stack = []
+    for match in _HTML_TAG_RE.finditer(chunk):
+        closing, name = match.group(1), match.group(2)
+        if closing:
+            assert stack and stack.pop() == name, chunk
+        else:
+            stack.append(name)
+    assert not stack, chunk
+    assert not _inside_html_tag(chunk, len(chunk)), chunk
+
+
+def test_short_text_is_a_single_chunk():
+    assert split_message("hello", 10) == ["hello"]
+
+
+def test_splits_on_paragraphs_before_words():
+    text = "First paragraph here.\n\nSecond one is here."
+    assert split_message(text, 30) == ["First paragraph here.", "Second one is here."]
+
+
+def test_limit_counts_utf16_units_and_keeps_emoji_whole():
+    thumbs = "👍🏽"  # surrogate pair plus skin tone modifier: 4 UTF-16 units
+    family = "👨‍👩‍👧"  # ZWJ sequence: 8 UTF-16 units
+    for glyph in (thumbs, family):
+        chunks = split_message(glyph * 50, 30)
+        assert "".join(chunks) == glyph * 50
+        assert all(_utf16_len(chunk) <= 30 for chunk in chunks)
+        assert all(chunk.startswith(glyph) and chunk.count(glyph) * len(glyph) == len(chunk)
+                   for chunk in chunks)
+
+
+def test_tags_are_closed_and_reopened_across_chunks():
+    text = "<b>" + "bold words " * 20 + "</b> tail"
+    chunks = split_message(text, 60, "HTML")
+
+    assert len(chunks) > 1
+    assert chunks[0].startswith("<b>") and chunks[1].startswith("<b>")
+    for chunk in chunks:
+        assert_balanced(chunk)
+        assert _utf16_len(chunk) <= 60
+    assert " ".join(_strip_html(chunk) for chunk in chunks).split() == _strip_html(text).split()
+
+
+def test_entities_are_never_split():
+    text = "&amp;" * 40
+    chunks = split_message(text, 23, "HTML")
+
+    assert "".join(chunks) == text
+    assert all(len(chunk) % len("&amp;") == 0 for chunk in chunks)
+
+
+def test_long_runs_of_tags_still_make_progress():
+    chunks = split_message("<b><i><u><s><code>" + "a" * 300, 20, "HTML")
+    assert "".join(_strip_html(chunk) for chunk in chunks) == "a" * 300
+
+    chunks = split_message("<b>" + "a" * 50, 6, "HTML")
+    assert "".join(chunks) == "a" * 50
+    assert all(not _inside_html_tag(chunk, len(chunk)) for chunk in chunks)
+
+
+def test_oversized_link_falls_back_to_plain_text():
+    text = '<a href="https://example.com/' + "p" * 200 + '">link</a> and more'
+    chunks = split_message(text, 100, "HTML")
+
+    assert all(_utf16_len(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunks).split() == ["link", "and", "more"]
+
+
+class FakeBot:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.attempts = []
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.attempts.append(text)
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text, kwargs))
+
+
+def make_context(bot):
+    tasks = []
+
+    def create_task(coroutine):
+        task = asyncio.ensure_future(coroutine)
+        tasks.append(task)
+        return task
+
+    return SimpleNamespace(bot=bot, application=SimpleNamespace(create_task=create_task),
+                           tasks=tasks)
+
+
+def send(sender, bot, *messages, **kwargs):
+    async def run():
+        context = make_context(bot)
+        for chat_id, text in messages:
+            sender.enqueue(context, chat_id, text, **kwargs)
+        await asyncio.gather(*context.tasks)
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def sender():
+    return OutboundSender(per_chat_interval=0, global_rate=1000)
+
+
+def test_messages_are_delivered_in_order_per_chat(sender):
+    bot = FakeBot()
+    send(sender, bot, (1, "a"), (2, "x"), (1, "b"))
+
+    assert [text for chat_id, text, _ in bot.sent if chat_id == 1] == ["a", "b"]
+    assert not sender._queues and not sender._workers and not sender._chat_ready_at
+
+
+def test_retry_after_delays_the_chat_and_the_whole_bot(sender):
+    bot = FakeBot([RetryAfter(timedelta(milliseconds=100))])
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        context = make_context(bot)
+        sender.enqueue(context, 1, "a")
+        await asyncio.sleep(0.01)
+        assert sender._next_global_slot >= started + 0.1
+        await asyncio.gather(*context.tasks)
+        return loop.time() - started
+
+    assert asyncio.run(run()) >= 0.1
+    assert bot.attempts == ["a", "a"]
+    assert [text for _, text, _ in bot.sent] == ["a"]
+
+
+def test_parse_error_falls_back_to_plain_text(sender):
+    bot = FakeBot([BadRequest("Can't parse entities: unsupported start tag")])
+    send(sender, bot, (1, "<b>a &amp; b</b>"), parse_mode="HTML")
+
+    assert bot.sent == [(1, "a & b", {})]
+
+
+def test_timed_out_send_is_not_resent(sender):
+    bot = FakeBot([TimedOut()])
+    send(sender, bot, (1, "a"), (1, "b"))
+
+    assert bot.attempts == ["a", "b"]
+    assert [text for _, text, _ in bot.sent] == ["b"]
+
+
+def test_network_error_is_retried(sender):
+    bot = FakeBot([NetworkError("connection reset")])
+    send(sender, bot, (1, "a"))
+
+    assert bot.attempts == ["a", "a"]
+
+
+def test_reply_adds_continuation_header(sender):
+    bot = FakeBot()
+
+    async def run():
+        context = make_context(bot)
+        sender.reply(context, 1, "word " * 1000, continuation_header="(cont.)\n")
+        await asyncio.gather(*context.tasks)
+
+    asyncio.run(run())
+    texts = [text for _, text, _ in bot.sent]
+    assert len(texts) == 2
+    assert not texts[0].startswith("(cont.)") and texts[1].startswith("(cont.)\n")
@@ -0,0 +1,242 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, ResilientGenerator
+
+
+class TransientError(ConnectionError):
+    pass
+
+
+class ModelError(Exception):
+    pass
+
+
+class FakeModel:
+    """Stand-in for a Gemini model that fails or stalls on demand.
+
+    The first `failures` calls raise `error`; call N sleeps `delays[N-1]` seconds first.
+    """
+
+    def __init__(self, failures=0, error=TransientError, delays=(), response="ok"):
+        self.failures = failures
+        self.error = error
+        self.delays = list(delays)
+        self.response = response
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self.request_options = None
+        self._lock = threading.Lock()
+
+    def generate_content(self, *args, request_options=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        self.request_options = request_options
+        try:
+            if call <= len(self.delays):
+                time.sleep(self.delays[call - 1])
+            if call <= self.failures:
+                raise self.error(f"injected failure {call}")
+            return f"{self.response}-{call}"
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_generator(models, threshold=5, clock=time.monotonic, **kwargs):
+    kwargs.setdefault("base_delay", 0.001)
+    kwargs.setdefault("hedge_delay", 0)
+    return ResilientGenerator(
+        models,
+        breaker_factory=lambda name: CircuitBreaker(name, failure_threshold=threshold,
+                                                    reset_timeout=30, clock=clock),
+        **kwargs
+    )
+
+
+def test_transient_errors_are_retried():
+    model = FakeModel(failures=2)
+    generator = make_generator([("primary", model)])
+
+    assert asyncio.run(generator.generate("hi")) == "ok-3"
+    assert model.calls == 3
+
+
+def test_request_errors_are_raised_without_retry_or_fallback():
+    models = [FakeModel(failures=1, error=ValueError) for _ in range(3)]
+    generator = make_generator([(f"m{i}", model) for i, model in enumerate(models)])
+
+    with pytest.raises(ValueError):
+        asyncio.run(generator.generate("hi"))
+    assert [model.calls for model in models] == [1, 0, 0]
+    assert generator.breakers["m0"].state == "closed"
+
+
+def test_model_errors_fall_back_and_open_the_circuit():
+    primary = FakeModel(failures=100, error=ModelError)
+    secondary = FakeModel(response="second")
+    generator = make_generator([("primary", primary), ("secondary", secondary)], threshold=2)
+
+    assert asyncio.run(generator.generate("hi")) == "second-1"
+    assert primary.calls == 1
+    assert asyncio.run(generator.generate("hi")) == "second-2"
+    assert generator.breakers["primary"].state == "open"
+    assert asyncio.run(generator.generate("hi")) == "second-3"
+    assert primary.calls == 2
+
+
+def test_transient_errors_are_retried_before_falling_back():
+    primary = FakeModel(failures=100)
+    secondary = FakeModel(response="second")
+    generator = make_generator([("primary", primary), ("secondary", secondary)])
+
+    assert asyncio.run(generator.generate("hi")) == "second-1"
+    assert (primary.calls, secondary.calls) == (3, 1)
+
+
+def test_timed_out_call_is_not_retried_on_the_same_model():
+    primary = FakeModel(delays=[0.5] * 3)
+    secondary = FakeModel(response="second")
+    generator = make_generator([("primary", primary), ("secondary", secondary)], timeout=0.1)
+
+    assert asyncio.run(generator.generate("hi")) == "second-1"
+    assert primary.calls == 1
+
+
+def test_request_deadline_stops_fallbacks():
+    models = [FakeModel(delays=[0.5]) for _ in range(3)]
+    generator = make_generator([(f"m{i}", model) for i, model in enumerate(models)],
+                               timeout=0.1, deadline=0.15)
+
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(generator.generate("hi"))
+    assert time.monotonic() - started < 0.3
+    assert [model.calls for model in models] == [1, 1, 0]
+    assert generator.breakers["m1"]._failures == 0
+
+
+def test_request_timeout_is_passed_to_the_model():
+    model = FakeModel()
+    generator = make_generator([("primary", model)], timeout=5)
+
+    asyncio.run(generator.generate("hi", request_options={"retry": None}))
+    assert model.request_options == {"retry": None, "timeout": 5}
+
+
+def test_falls_back_in_order_and_open_circuit_fails_fast():
+    primary = FakeModel(failures=100)
+    secondary = FakeModel(failures=100)
+    tertiary = FakeModel(response="third")
+    generator = make_generator(
+        [("primary", primary), ("secondary", secondary), ("tertiary", tertiary)], threshold=2
+    )
+
+    assert asyncio.run(generator.generate("hi")) == "third-1"
+    assert generator.breakers["primary"].state == "open"
+    assert generator.breakers["secondary"].state == "open"
+
+    calls = primary.calls, secondary.calls
+    assert asyncio.run(generator.generate("hi")) == "third-2"
+    assert (primary.calls, secondary.calls) == calls
+
+
+def test_all_circuits_open_raises():
+    generator = make_generator([("primary", FakeModel(failures=100))], threshold=1)
+
+    with pytest.raises(TransientError):
+        asyncio.run(generator.generate("hi"))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(generator.generate("hi"))
+
+
+def test_half_open_trial_closes_or_reopens_circuit():
+    clock = FakeClock()
+    model = FakeModel(failures=2)
+    generator = make_generator([("primary", model)], threshold=1, clock=clock, max_retries=0)
+    breaker = generator.breakers["primary"]
+
+    with pytest.raises(TransientError):
+        asyncio.run(generator.generate("hi"))
+    assert breaker.state == "open"
+
+    clock.now += 30
+    assert breaker.state == "half-open"
+    with pytest.raises(TransientError):
+        asyncio.run(generator.generate("hi"))
+    assert breaker.state == "open"
+
+    clock.now += 30
+    assert asyncio.run(generator.generate("hi")) == "ok-3"
+    assert breaker.state == "closed"
+
+
+def test_cancelled_trial_does_not_wedge_the_circuit():
+    clock = FakeClock()
+    model = FakeModel(failures=1, delays=[0, 0.3])
+    generator = make_generator([("primary", model)], threshold=1, clock=clock, max_retries=0)
+
+    with pytest.raises(TransientError):
+        asyncio.run(generator.generate("hi"))
+    clock.now += 30
+
+    async def cancel_trial():
+        task = asyncio.create_task(generator.generate("hi"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert generator.breakers["primary"].allow() == "trial"
+
+
+def test_slow_request_is_hedged():
+    model = FakeModel(delays=[1.0])
+    generator = make_generator([("primary", model)], hedge_delay=0.05)
+
+    started = time.monotonic()
+    assert asyncio.run(generator.generate("hi")) == "ok-2"
+    assert time.monotonic() - started < 0.5
+
+
+def test_hedge_delay_follows_observed_latency():
+    model = FakeModel(delays=[0.01] * 20 + [1.0])
+    generator = make_generator([("primary", model)], hedge_delay=None)
+
+    async def run():
+        await generator.generate("hi")
+        assert model.calls == 1  # no latency samples yet, so no hedge
+        for _ in range(19):
+            await generator.generate("hi")
+        started = time.monotonic()
+        assert await generator.generate("hi") == "ok-22"
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 0.5
+
+
+def test_concurrent_upstream_calls_are_bounded():
+    model = FakeModel(delays=[0.05] * 8)
+    generator = make_generator([("primary", model)], max_concurrency=2)
+
+    async def burst():
+        return await asyncio.gather(*(generator.generate("hi") for _ in range(8)))
+
+    assert len(asyncio.run(burst())) == 8
+    assert model.max_active == 2